@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import altair as alt
+import duckdb
 import os
 
 # Set page config
@@ -10,26 +12,166 @@ st.set_page_config(page_title="Nutrition & Obesity Dashboard", layout="wide")
 st.title("Nutrition, Physical Activity, and Obesity Dashboard")
 
 # Load Data
-@st.cache_data
-def load_data():
-    if os.path.exists('cleaned_data.csv'):
-        return pd.read_csv('cleaned_data.csv')
+# Cached data results are also pickled to ~/.streamlit/cache (persist='disk'),
+# so a restarted server reuses them instead of recomputing. The modification
+# time of the file each result is built from is part of its cache key, so
+# regenerating (or pulling) that file invalidates them.
+@st.cache_data(persist='disk')
+def load_data(data_version):
+    if os.path.exists('cleaned_data.parquet'):
+        return pd.read_parquet('cleaned_data.parquet', columns=['Year', 'LocationAbbr', 'LocationDesc', 'Class', 'Question',
+                                                                'Data_Value', 'StratificationCategory1', 'Stratification1'])
     else:
-        st.error("Data file 'cleaned_data.csv' not found. Please run data cleaning first.")
+        st.error("Data file 'cleaned_data.parquet' not found. Please run data cleaning first.")
         return None
 
-df = load_data()
+# Obesity and inactivity rates per (Year, state), pre-joined by data cleaning.
+# Only the correlation page needs it, so a missing file is handled there.
+@st.cache_data(persist='disk')
+def load_state_metrics(metrics_version):
+    if os.path.exists('state_metrics_wide.parquet'):
+        return pd.read_parquet('state_metrics_wide.parquet')
+    return None
+
+# One in-memory DuckDB database per server process, shared by all sessions.
+# The frame is copied into a real table so per-session cursors can see it.
+# Only the current data version is kept, so regenerating the data file drops
+# the old copy instead of accumulating one per version.
+@st.cache_resource(max_entries=1)
+def get_connection(_df, data_version):
+    con = duckdb.connect()
+    con.register('df_view', _df)
+    con.execute("CREATE TABLE df AS SELECT * FROM df_view")
+    con.unregister('df_view')
+    return con
+
+# Row slices for the pages that show raw records, keyed on the sidebar
+# selections so a rerun does a dict lookup instead of masking the full frame.
+# Built once per server process (and data version); the slices are shared read-only.
+@st.cache_resource(max_entries=1)
+def build_index(_df, data_version):
+    by_year_class = {key: g for key, g in _df.groupby(['Year', 'Class'], observed=True, sort=False)}
+    df_total = _df[_df['StratificationCategory1'] == 'Total']
+    total_by_year_question = {
+        key: g[['LocationDesc', 'Data_Value', 'Year']].astype({'LocationDesc': str})
+        for key, g in df_total.groupby(['Year', 'Question'], observed=True, sort=False)
+    }
+    questions_by_class = {c: list(g['Question'].unique()) for c, g in _df.groupby('Class', observed=True, sort=False)}
+    return by_year_class, total_by_year_question, questions_by_class
+
+# Chart builders: memoised on the selections that determine the chart, so a
+# repeat selection reuses the serialised Vega-Lite spec instead of re-running
+# the aggregation and Altair's JSON conversion. Data sources (`_`-prefixed)
+# are excluded from the cache key.
+@st.cache_data(persist='disk')
+def trend_chart_spec(_con, data_version, selected_class):
+    # Filter for Total population to show general trend
+    # Aggregate
+    trend_data = _con.execute("""
+        SELECT Year, Question::VARCHAR AS Question, AVG(Data_Value) AS Data_Value
+        FROM df
+        WHERE Class = ? AND StratificationCategory1 = 'Total'
+        GROUP BY Year, Question
+        ORDER BY Year, Question
+    """, [selected_class]).df()
+    
+    # Altair Chart
+    chart = alt.Chart(trend_data).mark_line(point=True).encode(
+        x=alt.X('Year:O', title='Year'),
+        y=alt.Y('Data_Value', title='Percentage (%)', scale=alt.Scale(zero=False)),
+        color='Question',
+        tooltip=['Year', 'Question', alt.Tooltip('Data_Value', format='.1f')]
+    ).properties(
+        width=800,
+        height=500,
+        title=f"Trends in {selected_class} (2011-2023)"
+    ).interactive()
+    return chart.to_dict()
+
+@st.cache_data(persist='disk')
+def geo_chart_spec(_df_geo, data_version, selected_year, selected_question):
+    # Sort for better visualization
+    df_geo = _df_geo.sort_values('Data_Value', ascending=False)
+    
+    # Altair Bar Chart (Better for ranking than a map without geojson)
+    chart = alt.Chart(df_geo).mark_bar().encode(
+        x=alt.X('Data_Value', title='Percentage (%)'),
+        y=alt.Y('LocationDesc', sort='-x', title='State'),
+        color=alt.Color('Data_Value', scale=alt.Scale(scheme='viridis')),
+        tooltip=['LocationDesc', alt.Tooltip('Data_Value', format='.1f'), 'Year']
+    ).properties(
+        height=800,
+        title=f"State Rankings for {selected_question} ({selected_year})"
+    ).interactive()
+    return chart.to_dict()
+
+@st.cache_data(persist='disk')
+def demo_chart_spec(_con, data_version, selected_demo, selected_question_demo, selected_year):
+    # Aggregate
+    demo_agg = _con.execute("""
+        SELECT Stratification1::VARCHAR AS Stratification1, AVG(Data_Value) AS Data_Value
+        FROM df
+        WHERE StratificationCategory1 = ? AND Question = ?
+          AND Year = ? -- Use global year filter
+        GROUP BY Stratification1
+        ORDER BY Stratification1
+    """, [selected_demo, selected_question_demo, selected_year]).df()
+    
+    # Altair Chart
+    chart = alt.Chart(demo_agg).mark_bar().encode(
+        x=alt.X('Stratification1', title=selected_demo, sort='-y'),
+        y=alt.Y('Data_Value', title='Percentage (%)'),
+        color=alt.Color('Stratification1', legend=None),
+        tooltip=['Stratification1', alt.Tooltip('Data_Value', format='.1f')]
+    ).properties(
+        title=f"Average {selected_question_demo} by {selected_demo} ({selected_year})"
+    ).interactive()
+    return chart.to_dict()
+
+# Returns (correlation coefficient, chart spec), or None when no state has both metrics
+@st.cache_data(persist='disk')
+def correlation_chart_spec(_state_metrics, metrics_version, selected_year):
+    merged = _state_metrics[_state_metrics['Year'] == selected_year]
+    
+    if merged.empty:
+        return None
+
+    # Pearson r straight on the aligned arrays
+    corr_coeff = np.corrcoef(merged['Obesity_Rate'].to_numpy(), merged['Inactivity_Rate'].to_numpy())[0, 1]
+    
+    # Altair Scatter Plot
+    chart = alt.Chart(merged).mark_circle(size=60).encode(
+        x=alt.X('Inactivity_Rate', title='Physical Inactivity (%)', scale=alt.Scale(zero=False)),
+        y=alt.Y('Obesity_Rate', title='Obesity Rate (%)', scale=alt.Scale(zero=False)),
+        tooltip=['LocationDesc', alt.Tooltip('Obesity_Rate', format='.1f'), alt.Tooltip('Inactivity_Rate', format='.1f')]
+    ).properties(
+        title=f"Obesity vs. Inactivity ({selected_year})"
+    ).interactive()
+    
+    # Regression line
+    line = chart.transform_regression('Inactivity_Rate', 'Obesity_Rate').mark_line(color='red')
+    return corr_coeff, (chart + line).to_dict()
+
+data_version = os.path.getmtime('cleaned_data.parquet') if os.path.exists('cleaned_data.parquet') else None
+df = load_data(data_version)
+metrics_version = os.path.getmtime('state_metrics_wide.parquet') if os.path.exists('state_metrics_wide.parquet') else None
+state_metrics = load_state_metrics(metrics_version)
 
 if df is not None:
+    # DuckDB connections are not thread-safe, so each rerun gets its own cursor
+    con = get_connection(df, data_version).cursor()
+    by_year_class, total_by_year_question, questions_by_class = build_index(df, data_version)
+
     # --- Sidebar Filters ---
     st.sidebar.header("Global Filters")
     
     # Year Filter
-    years = sorted(df['Year'].unique(), reverse=True)
+    years = [y for (y,) in con.execute("SELECT DISTINCT Year FROM df ORDER BY Year DESC").fetchall()]
     selected_year = st.sidebar.selectbox("Select Year", years, index=0)
     
     # Class Filter (Obesity, Physical Activity, etc.)
-    classes = df['Class'].unique()
+    # rowid keeps the categories in file order, matching Series.unique()
+    classes = [c for (c,) in con.execute("SELECT Class FROM df GROUP BY Class ORDER BY MIN(rowid)").fetchall()]
     selected_class = st.sidebar.selectbox("Select Category", classes, index=0)
 
     # Navigation
@@ -78,9 +220,9 @@ if df is not None:
         
         st.subheader("Summary Statistics (Filtered Data)")
         # Filter based on sidebar selection
-        df_stats = df[(df['Class'] == selected_class) & (df['Year'] == selected_year)]
+        df_stats = by_year_class.get((selected_year, selected_class))
         
-        if not df_stats.empty:
+        if df_stats is not None:
             col1, col2, col3 = st.columns(3)
             with col1:
                 st.metric("Mean Value (%)", f"{df_stats['Data_Value'].mean():.2f}")
@@ -90,7 +232,7 @@ if df is not None:
                 st.metric("Total Records", f"{len(df_stats)}")
             
             st.write("### Data Preview")
-            st.dataframe(df_stats.head())
+            st.dataframe(df_stats.head(), column_config={'Data_Value': st.column_config.NumberColumn(format='%.1f')})
         else:
             st.warning("No data available for the selected filters.")
 
@@ -99,25 +241,7 @@ if df is not None:
         st.header("Q1: How have health metrics changed over time?")
         st.markdown("This interactive chart shows the trend of the selected category over the years. **Hover** over points for details. **Zoom** and **Pan** are enabled.")
         
-        # Filter for Total population to show general trend
-        df_trend = df[(df['Class'] == selected_class) & (df['StratificationCategory1'] == 'Total')]
-        
-        # Aggregate
-        trend_data = df_trend.groupby(['Year', 'Question'])['Data_Value'].mean().reset_index()
-        
-        # Altair Chart
-        chart = alt.Chart(trend_data).mark_line(point=True).encode(
-            x=alt.X('Year:O', title='Year'),
-            y=alt.Y('Data_Value', title='Percentage (%)', scale=alt.Scale(zero=False)),
-            color='Question',
-            tooltip=['Year', 'Question', alt.Tooltip('Data_Value', format='.1f')]
-        ).properties(
-            width=800,
-            height=500,
-            title=f"Trends in {selected_class} (2011-2023)"
-        ).interactive()
-        
-        st.altair_chart(chart, use_container_width=True)
+        st.vega_lite_chart(trend_chart_spec(con, data_version, selected_class), use_container_width=True)
 
     # --- 4. Geographic Analysis ---
     elif selection == "4. Q2: Geographic Analysis":
@@ -125,28 +249,15 @@ if df is not None:
         st.markdown(f"Ranking of states for **{selected_class}** in **{selected_year}**.")
         
         # Filter data
-        questions = df[df['Class'] == selected_class]['Question'].unique()
+        questions = questions_by_class[selected_class]
         selected_question = st.selectbox("Select Metric", questions, index=0)
         
-        df_geo = df[(df['Year'] == selected_year) & 
-                    (df['Question'] == selected_question) & 
-                    (df['StratificationCategory1'] == 'Total')]
-        
-        # Sort for better visualization
-        df_geo = df_geo.sort_values('Data_Value', ascending=False)
+        df_geo = total_by_year_question.get((selected_year, selected_question))
+        if df_geo is None:
+            df_geo = pd.DataFrame(columns=['LocationDesc', 'Data_Value', 'Year']).astype(
+                {'LocationDesc': str, 'Data_Value': float, 'Year': int})
         
-        # Altair Bar Chart (Better for ranking than a map without geojson)
-        chart = alt.Chart(df_geo).mark_bar().encode(
-            x=alt.X('Data_Value', title='Percentage (%)'),
-            y=alt.Y('LocationDesc', sort='-x', title='State'),
-            color=alt.Color('Data_Value', scale=alt.Scale(scheme='viridis')),
-            tooltip=['LocationDesc', 'Data_Value', 'Year']
-        ).properties(
-            height=800,
-            title=f"State Rankings for {selected_question} ({selected_year})"
-        ).interactive()
-        
-        st.altair_chart(chart, use_container_width=True)
+        st.vega_lite_chart(geo_chart_spec(df_geo, data_version, selected_year, selected_question), use_container_width=True)
 
     # --- 5. Demographic Analysis ---
     elif selection == "5. Q3: Demographic Analysis":
@@ -156,69 +267,31 @@ if df is not None:
         selected_demo = st.selectbox("Select Demographic Category", demo_cats)
         
         # Filter
-        questions = df[df['Class'] == selected_class]['Question'].unique()
+        questions = questions_by_class[selected_class]
         selected_question_demo = st.selectbox("Select Metric", questions, index=0)
         
-        df_demo = df[(df['StratificationCategory1'] == selected_demo) & 
-                     (df['Question'] == selected_question_demo) &
-                     (df['Year'] == selected_year)] # Use global year filter
-        
-        # Aggregate
-        demo_agg = df_demo.groupby('Stratification1')['Data_Value'].mean().reset_index()
-        
-        # Altair Chart
-        chart = alt.Chart(demo_agg).mark_bar().encode(
-            x=alt.X('Stratification1', title=selected_demo, sort='-y'),
-            y=alt.Y('Data_Value', title='Percentage (%)'),
-            color=alt.Color('Stratification1', legend=None),
-            tooltip=['Stratification1', alt.Tooltip('Data_Value', format='.1f')]
-        ).properties(
-            title=f"Average {selected_question_demo} by {selected_demo} ({selected_year})"
-        ).interactive()
-        
-        st.altair_chart(chart, use_container_width=True)
+        st.vega_lite_chart(demo_chart_spec(con, data_version, selected_demo, selected_question_demo, selected_year),
+                           use_container_width=True)
 
     # --- 6. Correlation Analysis ---
     elif selection == "6. Correlation Analysis":
         st.header("Correlation: Obesity vs. Physical Inactivity")
         st.markdown(f"Analyzing the relationship for **{selected_year}**.")
         
-        # Prepare data
-        df_corr = df[(df['Year'] == selected_year) & (df['StratificationCategory1'] == 'Total')]
-        
         q_obesity = 'Percent of adults aged 18 years and older who have obesity'
         q_inactivity = 'Percent of adults who engage in no leisure-time physical activity'
         
-        # Check if questions exist in the dataset
-        available_questions = df_corr['Question'].unique()
-        has_obesity = any(q_obesity in q for q in available_questions)
-        has_inactivity = any(q_inactivity in q for q in available_questions)
+        # Check if questions exist in the dataset (Total stratification, selected year)
+        has_obesity = (selected_year, q_obesity) in total_by_year_question
+        has_inactivity = (selected_year, q_inactivity) in total_by_year_question
 
-        if has_obesity and has_inactivity:
-            # We need to be careful with exact string matching, so let's filter by substring if needed
-            # But the dataset seems consistent.
-            df_obesity = df_corr[df_corr['Question'] == q_obesity][['LocationAbbr', 'Data_Value', 'LocationDesc']].rename(columns={'Data_Value': 'Obesity_Rate'})
-            df_inactivity = df_corr[df_corr['Question'] == q_inactivity][['LocationAbbr', 'Data_Value']].rename(columns={'Data_Value': 'Inactivity_Rate'})
-            
-            merged = pd.merge(df_obesity, df_inactivity, on='LocationAbbr')
+        if state_metrics is not None and has_obesity and has_inactivity:
+            result = correlation_chart_spec(state_metrics, metrics_version, selected_year)
             
-            if not merged.empty:
-                corr_coeff = merged['Obesity_Rate'].corr(merged['Inactivity_Rate'])
+            if result is not None:
+                corr_coeff, spec = result
                 st.metric("Correlation Coefficient", f"{corr_coeff:.2f}")
-                
-                # Altair Scatter Plot
-                chart = alt.Chart(merged).mark_circle(size=60).encode(
-                    x=alt.X('Inactivity_Rate', title='Physical Inactivity (%)', scale=alt.Scale(zero=False)),
-                    y=alt.Y('Obesity_Rate', title='Obesity Rate (%)', scale=alt.Scale(zero=False)),
-                    tooltip=['LocationDesc', 'Obesity_Rate', 'Inactivity_Rate']
-                ).properties(
-                    title=f"Obesity vs. Inactivity ({selected_year})"
-                ).interactive()
-                
-                # Regression line
-                line = chart.transform_regression('Inactivity_Rate', 'Obesity_Rate').mark_line(color='red')
-                
-                st.altair_chart(chart + line, use_container_width=True)
+                st.vega_lite_chart(spec, use_container_width=True)
             else:
                 st.warning("Not enough data to perform correlation analysis for this year.")
         else:
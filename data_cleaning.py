@@ -1,45 +1,94 @@
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pac
+import csv
 import os
 
-def clean_data(input_path, output_path):
-    print(f"Loading data from {input_path}...")
-    try:
-        df = pd.read_csv(input_path)
-    except FileNotFoundError:
-        print(f"Error: File not found at {input_path}")
-        return
-
-    initial_rows = len(df)
-    print(f"Initial rows: {initial_rows}")
-
-    # 1. Drop rows with missing Data_Value
-    df_clean = df.dropna(subset=['Data_Value'])
-    print(f"Rows after dropping missing Data_Value: {len(df_clean)}")
-
-    # 2. Select relevant columns
+def clean_data(input_path, output_path, wide_output_path='state_metrics_wide.parquet'):
     # We need: YearStart, LocationAbbr, LocationDesc, Class, Topic, Question, Data_Value, 
     # StratificationCategory1, Stratification1, GeoLocation
     cols_to_keep = [
         'YearStart', 'LocationAbbr', 'LocationDesc', 'Class', 'Topic', 'Question', 
         'Data_Value', 'Data_Value_Unit', 'StratificationCategory1', 'Stratification1', 'GeoLocation'
     ]
+
+    print(f"Loading data from {input_path}...")
+    try:
+        with open(input_path, newline='') as f:
+            header = next(csv.reader(f))
+    except FileNotFoundError:
+        print(f"Error: File not found at {input_path}")
+        return
+
     # Check if all columns exist
-    missing_cols = [c for c in cols_to_keep if c not in df_clean.columns]
+    missing_cols = [c for c in cols_to_keep if c not in header]
     if missing_cols:
         print(f"Warning: Missing columns: {missing_cols}")
         return
 
+    # Stream the raw file through Arrow's multi-threaded CSV reader in blocks.
+    # Columns we don't keep (the raw file has ~33) are skipped by the tokenizer
+    # and the numeric columns are typed up front instead of inferred.
+    reader = pac.open_csv(
+        input_path,
+        read_options=pac.ReadOptions(use_threads=True, block_size=16 << 20),
+        convert_options=pac.ConvertOptions(
+            include_columns=cols_to_keep,
+            # Data_Value is a one-decimal percentage and YearStart a year, so
+            # float32/int16 hold them to display precision (not bit-exact for
+            # Data_Value) while halving their footprint
+            column_types={'YearStart': pa.int16(), 'Data_Value': pa.float32(), 'Data_Value_Unit': pa.string()},
+            strings_can_be_null=True,
+        ),
+    )
+    initial_rows = 0
+    batches = []
+    for batch in reader:
+        initial_rows += batch.num_rows
+        # 1. Drop rows with missing Data_Value
+        batches.append(batch.filter(pc.is_valid(batch.column('Data_Value'))))
+
+    print(f"Initial rows: {initial_rows}")
+
+    df_clean = pa.Table.from_batches(batches, schema=reader.schema).to_pandas()
+    print(f"Rows after dropping missing Data_Value: {len(df_clean)}")
+
+    # 2. Select relevant columns
     df_clean = df_clean[cols_to_keep]
 
     # 3. Standardize Year
     df_clean = df_clean.rename(columns={'YearStart': 'Year'})
 
-    # 4. Save cleaned data
+    # 4. Store the low-cardinality text columns as categoricals; Parquet keeps
+    # them dictionary-encoded, so readers get category dtype back for free
+    for c in ['LocationAbbr', 'LocationDesc', 'Class', 'Topic', 'Question', 'Data_Value_Unit',
+              'StratificationCategory1', 'Stratification1']:
+        df_clean[c] = df_clean[c].astype('category')
+
+    # 5. Save cleaned data
     print(f"Saving cleaned data to {output_path}...")
-    df_clean.to_csv(output_path, index=False)
+    df_clean.to_parquet(output_path, engine='pyarrow', compression='snappy', index=False)
+
+    # 6. State-level obesity vs. physical inactivity, one row per (Year, state),
+    # so the correlation views read it directly instead of re-joining the questions
+    q_obesity = 'Percent of adults aged 18 years and older who have obesity'
+    q_inactivity = 'Percent of adults who engage in no leisure-time physical activity'
+    df_wide = df_clean[(df_clean['StratificationCategory1'] == 'Total') &
+                       (df_clean['Question'].isin([q_obesity, q_inactivity]))]
+    df_wide = (df_wide.pivot_table(index=['Year', 'LocationAbbr', 'LocationDesc'], columns='Question',
+                                   values='Data_Value', aggfunc='mean', observed=True)
+               .rename(columns={q_obesity: 'Obesity_Rate', q_inactivity: 'Inactivity_Rate'})
+               .dropna()
+               .reset_index()
+               .astype({'LocationAbbr': str, 'LocationDesc': str}))
+    df_wide.columns.name = None
+
+    print(f"Saving state metrics to {wide_output_path}...")
+    df_wide.to_parquet(wide_output_path, engine='pyarrow', compression='snappy', index=False)
     print("Data cleaning complete.")
 
 if __name__ == "__main__":
     input_csv = 'Nutrition__Physical_Activity__and_Obesity_-_Behavioral_Risk_Factor_Surveillance_System.csv'
-    output_csv = 'cleaned_data.csv'
-    clean_data(input_csv, output_csv)
+    output_parquet = 'cleaned_data.parquet'
+    wide_output_parquet = 'state_metrics_wide.parquet'
+    clean_data(input_csv, output_parquet, wide_output_parquet)